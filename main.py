@@ -1,31 +1,95 @@
 import chess
 import chess.engine
-import pandas as pd
-import concurrent.futures
+import psutil
+import numpy as np
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
 import os
 import csv
 import logging
+import logging.handlers
 from collections import defaultdict
 import time
 import argparse
+import subprocess
 import re
+import sqlite3
+import hashlib
+import operator
+import functools
+import shutil
 
 
-def setup_worker_logging(engine_name, worker_id):
-    """Configures the chess.engine logger for a specific worker process."""
-    uci_logger = logging.getLogger("chess.engine")
+# Marks the end of the task queue for a worker, and a worker's exit on the result queue.
+SENTINEL = None
 
-    if uci_logger.hasHandlers():
-        uci_logger.handlers.clear()
+# Wall-clock seconds of work a worker aims to claim per pull from the task queue.
+BATCH_TARGET_SECONDS = 15.0
+EMA_ALPHA = 0.3
+
+# Minimum number of batches per worker the FENs are split into, so that a worker
+# stuck on slow positions near the end cannot hold back the whole run.
+BATCHES_PER_WORKER = 4
+
+# Digit runs of a position id, e.g. "STS(v1.0) Undermine.001" -> 1, 0, 001.
+_DIGITS_RE = re.compile(r'\d+')
+
+# Trailing position number of a position id description, e.g. ".001".
+_POSITION_NUMBER_RE = re.compile(r'\.\d+$')
+
+# The four FEN fields of an EPD line followed by its operations. Lines with an en
+# passant square, or castling rights other than KQkq letters, go through chess.Board.
+_EPD_RE = re.compile(r'(?P<placement>[pnbrqkPNBRQK1-8/]+)\s+(?P<turn>[wb])\s+(?P<castling>-|[KQkq]+)\s+-(?:\s+(?P<ops>.*))?')
+
+# Castling rights in FEN order, with the rank (0 = 8th, 7 = 1st), king file and rook file they need.
+_CASTLING_SQUARES = (('K', 7, 'K', 4, 'R', 7), ('Q', 7, 'K', 4, 'R', 0), ('k', 0, 'k', 4, 'r', 7), ('q', 0, 'k', 4, 'r', 0))
 
-    log_filename = f"{engine_name.replace(' ', '_')}_analysis_worker_{worker_id}.txt"
+# One EPD operation: an opcode and its operands, terminated by a semicolon.
+_EPD_OP_RE = re.compile(r'\s*(?P<opcode>[A-Za-z]\w*)(?P<operands>(?:\s+(?:"[^"\\]*"|[^\s;"]+))*)\s*;\s*')
+_EPD_STRING_RE = re.compile(r'"([^"\\]*)"')
+
+# Opcodes read by the EPD parser, and opcodes that change the FEN it must produce.
+_EPD_USED_OPCODES = frozenset(('id', 'c8', 'c9'))
+_EPD_FEN_OPCODES = frozenset(('hmvc', 'fmvn'))
+
+# EPD files with fewer lines than this are parsed in the main process.
+PARALLEL_PARSE_MIN_LINES = 5000
+
+# Maximum number of keys bound into a single SELECT against the move cache.
+CACHE_QUERY_BATCH = 500
+
+
+def start_uci_log_listener(engine_name):
+    """Starts a listener thread that writes the UCI log records sent by all workers to one file."""
+    log_filename = f"{engine_name.replace(' ', '_')}_analysis.txt"
 
     uci_log_handler = logging.FileHandler(log_filename, mode="w")
     uci_log_handler.setLevel(logging.DEBUG)
     uci_log_handler.setFormatter(logging.Formatter('%(asctime)s - (PID:%(process)d) - %(message)s'))
 
+    log_queue = multiprocessing.Queue()
+    log_listener = logging.handlers.QueueListener(log_queue, uci_log_handler)
+    log_listener.start()
+    return log_queue, log_listener
+
+
+def stop_uci_log_listener(log_listener):
+    """Flushes the remaining queued UCI log records and closes the log file."""
+    log_listener.stop()
+    for handler in log_listener.handlers:
+        handler.close()
+
+
+def setup_worker_logging(log_queue):
+    """Configures the chess.engine logger of a worker process to send records to the log listener."""
+    uci_logger = logging.getLogger("chess.engine")
+
+    if uci_logger.hasHandlers():
+        uci_logger.handlers.clear()
+
     uci_logger.setLevel(logging.DEBUG)
-    uci_logger.addHandler(uci_log_handler)
+    uci_logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
 
 def create_chunks(data_list, num_chunks):
@@ -40,47 +104,380 @@ def create_chunks(data_list, num_chunks):
     return chunks
 
 
-def analyze_chunk(fen_chunk, worker_id, engine_name, engine_path, move_time, custom_options, enable_uci_log):
-    """Worker function: Starts and configures an engine to analyze a chunk of FENs."""
-    if enable_uci_log:
-        setup_worker_logging(engine_name, worker_id)
+def natural_sort_key(text):
+    """Returns the numbers in text as a tuple of ints, so "STS(v2.2)" sorts before "STS(v10.0)"."""
+    return tuple(map(int, _DIGITS_RE.findall(text)))
+
 
-    chunk_results = {}
+def save_csv(filename, header, rows):
+    """Writes a header and rows to a CSV file, with the same line endings as pandas' to_csv."""
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        csv_writer = csv.writer(csvfile, lineterminator=os.linesep)
+        csv_writer.writerow(header)
+        csv_writer.writerows(rows)
+
+
+def engine_fingerprint(engine_path):
+    """Identifies the engine binary by path, size and modification time, so a rebuilt engine misses the cache."""
+    # A bare command name is looked up on PATH, the same way the engine itself is started.
+    engine_path = os.path.abspath(shutil.which(engine_path) or engine_path)
     try:
-        engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-
-        # Configure any custom UCI options provided
-        if custom_options:
-            for option_str in custom_options:
-                if "=" in option_str:
-                    name, value = option_str.split("=", 1)
-                    try:
-                        engine.configure({name.strip(): value.strip()})
-                    except Exception as e:
-                        print(f"Worker {worker_id} Warning: Could not set option '{name}'. Engine says: {e}")
+        stat = os.stat(engine_path)
+    except OSError:
+        return engine_path
+    return f"{engine_path}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def cache_key(engine_name, engine_id, move_time, custom_options, isolate_positions, fen):
+    """Builds the key identifying one engine analysis of a FEN in the move cache."""
+    options = sorted(custom_options or [])
+    key_str = f"{engine_name}|{engine_id}|{move_time}|{options}|{isolate_positions}|{fen}"
+    return hashlib.blake2b(key_str.encode(), digest_size=16).hexdigest()
+
+
+def open_cache(engine_name):
+    """Opens, creating it if needed, the SQLite cache of engine moves for an engine."""
+    cache_filename = f"{engine_name.replace(' ', '_')}.cache.sqlite"
+    conn = sqlite3.connect(cache_filename)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS moves(key TEXT PRIMARY KEY, uci TEXT)")
+    return conn
+
+
+def load_cached_moves(conn, fen_keys):
+    """Returns the cached engine moves for the FENs in fen_keys, a mapping of FEN to cache key."""
+    fen_by_key = {key: fen for fen, key in fen_keys.items()}
+    keys = list(fen_by_key)
+    cached_moves = {}
+    for i in range(0, len(keys), CACHE_QUERY_BATCH):
+        key_batch = keys[i : i + CACHE_QUERY_BATCH]
+        placeholders = ",".join("?" * len(key_batch))
+        for key, uci in conn.execute(f"SELECT key, uci FROM moves WHERE key IN ({placeholders})", key_batch):
+            cached_moves[fen_by_key[key]] = uci
+    return cached_moves
+
+
+def store_cached_moves(conn, fen_keys, engine_moves):
+    """Saves a batch of newly analyzed engine moves to the cache in a single transaction."""
+    rows = [(fen_keys[fen], uci) for fen, uci in engine_moves.items() if uci is not None]
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO moves(key, uci) VALUES (?, ?)", rows)
+
+
+def physical_core_cpus():
+    """Returns one logical CPU id per physical core this process may run on, or None if the topology is unknown."""
+    allowed_cpus = sorted(psutil.Process().cpu_affinity())
+    seen_cores, core_cpus = set(), []
+    for cpu in allowed_cpus:
+        try:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list") as f:
+                siblings = f.read().strip()
+        except OSError:
+            # No sysfs topology (e.g. Windows). Guessing the sibling layout goes wrong on hybrid CPUs.
+            return None
+        if siblings not in seen_cores:
+            seen_cores.add(siblings)
+            core_cpus.append(cpu)
+    return core_cpus
+
+
+def default_worker_count():
+    """Returns the number of physical cores this process may run on, for the --workers default."""
+    core_cpus = physical_core_cpus() if hasattr(psutil.Process, "cpu_affinity") else None
+    if core_cpus:
+        return len(core_cpus)
+    return psutil.cpu_count(logical=False) or 1
+
+
+def select_worker_cores(num_workers, custom_options):
+    """Picks a distinct physical core for each worker, or returns None if the workers should not be pinned."""
+    if not hasattr(psutil.Process, "cpu_affinity"):
+        print("CPU pinning is not supported on this platform, workers will not be pinned.")
+        return None
+
+    for option_str in custom_options or []:
+        name, _, value = option_str.partition("=")
+        if name.strip().lower() == "threads" and value.strip() != "1":
+            print("Engine uses more than one thread, workers will not be pinned.")
+            return None
+
+    core_cpus = physical_core_cpus()
+    if core_cpus is None:
+        print("CPU topology is not available on this platform, workers will not be pinned.")
+        return None
+    if num_workers > len(core_cpus):
+        print(f"More workers than physical cores ({len(core_cpus)}), workers will not be pinned.")
+        return None
+    return core_cpus[:num_workers]
+
+
+def pin_to_core(pid, core_id, worker_id):
+    """Restricts a process to a single logical CPU, warning instead of failing if that is not allowed."""
+    try:
+        psutil.Process(pid).cpu_affinity([core_id])
+    except (psutil.Error, OSError) as e:
+        print(f"Worker {worker_id} Warning: Could not pin process {pid} to CPU {core_id}: {e}")
+
+
+def pack_fens(fens):
+    """Copies FENs into a new shared memory block: a uint32 offset table followed by the FEN bytes."""
+    encoded_fens = [fen.encode('utf-8') for fen in fens]
+    offsets = np.zeros(len(encoded_fens) + 1, dtype=np.uint32)
+    np.cumsum([len(encoded) for encoded in encoded_fens], out=offsets[1:])
+    fen_bytes = b''.join(encoded_fens)
+
+    table_size = offsets.nbytes
+    fen_buffer = shared_memory.SharedMemory(create=True, size=table_size + len(fen_bytes))
+    fen_buffer.buf[:table_size] = offsets.tobytes()
+    fen_buffer.buf[table_size:table_size + len(fen_bytes)] = fen_bytes
+    return fen_buffer
+
+
+def read_fen_offsets(fen_buffer, num_fens):
+    """Returns the offset table of a buffer made by pack_fens as a list of ints."""
+    return np.frombuffer(fen_buffer.buf, dtype=np.uint32, count=num_fens + 1).tolist()
+
+
+def query_engine_name(engine_path, timeout=10.0):
+    """Reads the engine name from its UCI handshake, without the full python-chess engine setup."""
+    # The engine answers "uci" with its id lines and "uciok" before it reads "quit".
+    with subprocess.Popen([engine_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace") as proc:
+        try:
+            output, _ = proc.communicate("uci\nquit\n", timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise
+
+    for line in output.splitlines():
+        if line.startswith("id name "):
+            return line[len("id name "):].strip()
+        if line.startswith("uciok"):
+            break
+    raise ValueError("The engine did not report an 'id name' before 'uciok'.")
+
+
+def apply_options(engine, custom_options, worker_id):
+    """Configures any custom UCI options provided in Name=Value form."""
+    if not custom_options:
+        return
+    for option_str in custom_options:
+        if "=" in option_str:
+            name, value = option_str.split("=", 1)
+            try:
+                engine.configure({name.strip(): value.strip()})
+            except Exception as e:
+                print(f"Worker {worker_id} Warning: Could not set option '{name}'. Engine says: {e}")
+        else:
+            print(f"Worker {worker_id} Warning: Ignoring invalid option format '{option_str}'. Use Name=Value.")
+
+
+def start_engine(engine_path, custom_options, worker_id, core_id):
+    """Starts the engine a worker keeps for its whole lifetime, pinned to core_id and configured."""
+    # Pin the worker before starting the engine so the engine inherits the affinity,
+    # then pin the engine explicitly in case the platform does not propagate it.
+    if core_id is not None:
+        pin_to_core(os.getpid(), core_id, worker_id)
+
+    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+
+    if core_id is not None:
+        pin_to_core(engine.transport.get_pid(), core_id, worker_id)
+
+    apply_options(engine, custom_options, worker_id)
+    return engine
+
+
+def analyze_worker(fen_buffer_name, num_fens, task_queue, result_queue, worker_id, engine_path, move_time, custom_options, log_queue, isolate_positions, max_batch_size, core_id):
+    """Worker process: Keeps one engine alive and pulls FENs from the shared task queue until a sentinel arrives."""
+    if log_queue is not None:
+        setup_worker_logging(log_queue)
+
+    engine = None
+    fen_buffer = None
+    batch_results = {}
+    try:
+        # The task queue only carries indices into the shared FEN buffer.
+        fen_buffer = shared_memory.SharedMemory(name=fen_buffer_name)
+        offsets = read_fen_offsets(fen_buffer, num_fens)
+        table_size = (num_fens + 1) * np.dtype(np.uint32).itemsize
+
+        engine = start_engine(engine_path, custom_options, worker_id, core_id)
+
+        # python-chess only sends ucinewgame when the game object changes, so a shared
+        # token clears the engine's hash once per worker instead of once per FEN.
+        game_token = object()
+
+        # The limit never changes and python-chess copies the board it is given,
+        # so both are built once and reused for every FEN.
+        limit = chess.engine.Limit(time=move_time)
+        board = chess.Board()
+
+        # Claim FENs in batches sized to roughly BATCH_TARGET_SECONDS of work,
+        # based on an exponential moving average of the time spent per FEN.
+        ema_seconds = None
+        batch_size = 1
+        exhausted = False
+        while not exhausted:
+            batch = []
+            while len(batch) < batch_size:
+                index = task_queue.get()
+                if index is SENTINEL:
+                    exhausted = True
+                    break
+                batch.append(index)
+
+            for index in batch:
+                t0 = time.perf_counter()
+                fen = bytes(fen_buffer.buf[table_size + offsets[index] : table_size + offsets[index + 1]]).decode('utf-8')
+                try:
+                    board.set_fen(fen)
+                except ValueError as e:
+                    # One bad position must not take the rest of the queue down with the worker.
+                    print(f"Worker {worker_id} Warning: Skipping invalid FEN '{fen}'. Details: {e}")
+                    batch_results[index] = None
+                    continue
+
+                # game=object() forces the chess library to send ucinewgame command to the engine
+                game = object() if isolate_positions else game_token
+                info = engine.analyse(board, limit, game=game)
+                if "pv" in info and info["pv"]:
+                    batch_results[index] = info["pv"][0].uci()
                 else:
-                    print(f"Worker {worker_id} Warning: Ignoring invalid option format '{option_str}'. Use Name=Value.")
+                    batch_results[index] = None
 
-        for fen in fen_chunk:
-            board = chess.Board(fen)
+                elapsed = time.perf_counter() - t0
+                ema_seconds = elapsed if ema_seconds is None else EMA_ALPHA * elapsed + (1 - EMA_ALPHA) * ema_seconds
 
-            # game=object() forces the chess library to send ucinewgame command to the engine
-            info = engine.analyse(board, chess.engine.Limit(time=move_time), game=object())
-            if "pv" in info and info["pv"]:
-                chunk_results[fen] = info["pv"][0].uci()
-            else:
-                chunk_results[fen] = None
+            if batch_results:
+                result_queue.put(batch_results)
+                batch_results = {}
+            if ema_seconds:
+                batch_size = min(max(1, int(BATCH_TARGET_SECONDS / ema_seconds)), max_batch_size)
     except Exception as e:
-        if enable_uci_log:
+        # Keep what this batch finished before the error, it can be up to BATCH_TARGET_SECONDS of work.
+        if batch_results:
+            result_queue.put(batch_results)
+        print(f"Worker {worker_id} Warning: Stopped after an error. Details: {e}")
+        if log_queue is not None:
             logging.getLogger("chess.engine").error(f"Error in worker process {worker_id}: {e}", exc_info=True)
     finally:
-        if 'engine' in locals():
-            engine.quit()
-    return chunk_results
+        try:
+            if engine:
+                engine.quit()
+        except chess.engine.EngineError:
+            # quit() raises if the engine has already died.
+            pass
+        finally:
+            if fen_buffer:
+                fen_buffer.close()
+            # Tell the parent this worker is done, whether it finished or failed.
+            result_queue.put(SENTINEL)
+
+
+def expand_placement(placement):
+    """Expands the piece placement of a FEN into 8 strings of 8 squares, '.' for empty.
+
+    Returns None for anything chess.Board.set_fen rejects: a row count other
+    than 8, a row that does not add up to 8 squares, or two digits in a row.
+    """
+    rows = placement.split('/')
+    if len(rows) != 8:
+        return None
+
+    expanded_rows = []
+    for row in rows:
+        squares = []
+        previous_was_digit = False
+        for c in row:
+            if c.isdigit():
+                if previous_was_digit:
+                    return None
+                squares.append('.' * int(c))
+                previous_was_digit = True
+            else:
+                squares.append(c)
+                previous_was_digit = False
+        expanded_row = ''.join(squares)
+        if len(expanded_row) != 8:
+            return None
+        expanded_rows.append(expanded_row)
+    return expanded_rows
+
+
+def clean_castling(castling, expanded_rows):
+    """Drops castling rights whose king or rook has left its home square, as board.fen() does."""
+    rights = ''.join(
+        right for right, rank, king, king_file, rook, rook_file in _CASTLING_SQUARES
+        if right in castling and expanded_rows[rank][king_file] == king and expanded_rows[rank][rook_file] == rook
+    )
+    return rights or '-'
+
+
+def parse_epd_fields(epd):
+    """Pulls the FEN and the id, c8 and c9 strings out of an EPD line with regexes.
+
+    Returns None when the line has anything the regexes do not cover, in which
+    case it has to be parsed with chess.Board.set_epd instead.
+    """
+    match = _EPD_RE.fullmatch(epd)
+    if not match:
+        return None
+    expanded_rows = expand_placement(match.group('placement'))
+    if not expanded_rows:
+        return None
+
+    epd_info = {}
+    ops, pos = match.group('ops') or '', 0
+    while pos < len(ops):
+        op_match = _EPD_OP_RE.match(ops, pos)
+        if not op_match:
+            return None
+        opcode = op_match.group('opcode')
+        if opcode in _EPD_FEN_OPCODES:
+            return None
+        if opcode in _EPD_USED_OPCODES:
+            operand = _EPD_STRING_RE.fullmatch(op_match.group('operands').strip())
+            if not operand:
+                return None
+            epd_info[opcode] = operand.group(1)
+        pos = op_match.end()
+
+    castling = clean_castling(match.group('castling'), expanded_rows)
+    fen = f"{match.group('placement')} {match.group('turn')} {castling} - 0 1"
+    return fen, epd_info
+
+
+def parse_epd_lines(epd_lines):
+    """Parses EPD lines into four parallel lists with one entry per graded move: UCI moves, points, FENs and ids."""
+    uci_moves, points_list, fens, ids = [], [], [], []
+    for epd in epd_lines:
+        try:
+            fields = parse_epd_fields(epd)
+            if fields:
+                fen, epd_info = fields
+            else:
+                board = chess.Board()
+                epd_info = board.set_epd(epd)
+                fen = board.fen()
+            moves = epd_info.get('c9', '').split()
+            points = [int(p) for p in epd_info.get('c8', '0').split()]
+        except (ValueError, KeyError):
+            continue
+        if len(moves) != len(points):
+            continue
+
+        position_id = epd_info.get('id', '')
+        uci_moves.extend(moves)
+        points_list.extend(points)
+        fens.extend([fen] * len(moves))
+        ids.extend([position_id] * len(moves))
+    return uci_moves, points_list, fens, ids
 
 
-def parse_epd_file(filepath):
-    """Reads an EPD file and parses it into a structured pandas DataFrame."""
+def parse_epd_file(filepath, num_workers=1):
+    """Reads an EPD file and parses it into columns of one row per graded move."""
     print(f"Parsing EPD file: {filepath}...")
     try:
         with open(filepath, 'r') as f:
@@ -89,65 +486,137 @@ def parse_epd_file(filepath):
         print(f"Error: Could not find the file '{filepath}'")
         return None
 
-    dfs_list = []
-    for epd in epd_lines:
-        board = chess.Board()
-        try:
-            epd_info = board.set_epd(epd)
-            df_data = {
-                'uci_move': epd_info.get('c9', '').split(),
-                'points': [int(p) for p in epd_info.get('c8', '0').split()],
-                'fen': board.fen(),
-                'id': epd_info.get('id', '')
-            }
-            dfs_list.append(pd.DataFrame(df_data))
-        except (ValueError, KeyError):
-            continue
-
-    if not dfs_list:
+    # Small suites parse faster than a process pool starts up.
+    if num_workers > 1 and len(epd_lines) >= PARALLEL_PARSE_MIN_LINES:
+        with multiprocessing.Pool(num_workers) as pool:
+            chunk_results = pool.map(parse_epd_lines, create_chunks(epd_lines, num_workers))
+    else:
+        chunk_results = [parse_epd_lines(epd_lines)]
+
+    # One row per graded move, accumulated in plain lists.
+    uci_moves, points_list, fens, ids = [], [], [], []
+    for chunk_moves, chunk_points, chunk_fens, chunk_ids in chunk_results:
+        uci_moves.extend(chunk_moves)
+        points_list.extend(chunk_points)
+        fens.extend(chunk_fens)
+        ids.extend(chunk_ids)
+
+    if not fens:
         return None
 
-    return pd.concat(dfs_list, ignore_index=True)
+    return {'uci_move': uci_moves, 'points': points_list, 'fen': fens, 'id': ids}
+
 
+def run_analysis(fens_to_analyze, num_workers, engine_path, move_time, custom_options, log_queue, isolate_positions, pin_workers, save_results=None):
+    """Runs the engine analysis concurrently, with each worker pulling FENs from a shared queue.
 
-def run_analysis(fens_to_analyze, num_workers, engine_name, engine_path, move_time, custom_options, enable_uci_log):
-    """Runs the engine analysis concurrently, passing settings to each worker."""
-    fen_chunks = create_chunks(fens_to_analyze, num_workers)
+    If save_results is given, it is called with each batch of results as it arrives,
+    so finished work survives a crash or interruption of the run.
+    """
     engine_moves = {}
+    if not fens_to_analyze:
+        return engine_moves
+
+    num_workers = max(1, min(num_workers, len(fens_to_analyze)))
+    max_batch_size = max(1, len(fens_to_analyze) // (BATCHES_PER_WORKER * num_workers))
+    worker_cores = select_worker_cores(num_workers, custom_options) if pin_workers else None
+
+    fen_buffer = pack_fens(fens_to_analyze)
+    task_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+    for index in range(len(fens_to_analyze)):
+        task_queue.put(index)
+    for _ in range(num_workers):
+        task_queue.put(SENTINEL)
+
+    def collect_batch(batch_results):
+        batch_moves = {fens_to_analyze[index]: uci_move for index, uci_move in batch_results.items()}
+        engine_moves.update(batch_moves)
+        if save_results:
+            save_results(batch_moves)
 
     print(f"Starting analysis of {len(fens_to_analyze)} positions with {num_workers} workers...")
-    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
-        future_to_chunk = {}
-        for worker_id, chunk in enumerate(fen_chunks, 1):
-            future = executor.submit(
-                analyze_chunk,
-                chunk,
-                worker_id,
-                engine_name,
-                engine_path,
-                move_time,
-                custom_options,
-                enable_uci_log
+    workers = []
+    completed = False
+    try:
+        for worker_id in range(1, num_workers + 1):
+            worker = multiprocessing.Process(
+                target=analyze_worker,
+                args=(
+                    fen_buffer.name,
+                    len(fens_to_analyze),
+                    task_queue,
+                    result_queue,
+                    worker_id,
+                    engine_path,
+                    move_time,
+                    custom_options,
+                    log_queue,
+                    isolate_positions,
+                    max_batch_size,
+                    worker_cores[worker_id - 1] if worker_cores else None
+                )
             )
-            future_to_chunk[future] = chunk
-
-        for future in concurrent.futures.as_completed(future_to_chunk):
-            chunk_result = future.result()
-            engine_moves.update(chunk_result)
+            worker.start()
+            workers.append(worker)
+
+        finished_workers = 0
+        while finished_workers < num_workers:
+            try:
+                batch_results = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that died without reporting back would otherwise block forever.
+                if not any(worker.is_alive() for worker in workers):
+                    # A worker may have put its last batch and exited since the get() timed out.
+                    while True:
+                        try:
+                            batch_results = result_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if batch_results is not SENTINEL:
+                            collect_batch(batch_results)
+                    break
+                continue
+            if batch_results is SENTINEL:
+                finished_workers += 1
+            else:
+                collect_batch(batch_results)
+        completed = True
+    finally:
+        # On an error or Ctrl+C, stop the workers rather than leave them running
+        # to be joined at exit. The shared FEN buffer is released either way.
+        for worker in workers:
+            if not completed:
+                worker.terminate()
+            worker.join()
+        fen_buffer.close()
+        fen_buffer.unlink()
+
+        # FENs left unclaimed by failed workers must not block interpreter exit.
+        task_queue.cancel_join_thread()
 
     print(f"\nAnalysis complete.")
     return engine_moves
 
 
-def calculate_scores(engine_name, engine_moves, df):
-    """Calculates scores and saves a sorted, detailed analysis to a CSV file."""
+def build_epd_lookup(epd_columns):
+    """Maps each FEN to its position id and a dict of graded UCI moves to points."""
     epd_data_lookup = {}
-    for fen, group in df.groupby('fen'):
-        epd_data_lookup[fen] = {
-            'id': group['id'].iloc[0],
-            'scored_moves': list(zip(group['uci_move'], group['points']))
-        }
+    for fen, move, move_points, position_id in zip(
+        epd_columns['fen'], epd_columns['uci_move'], epd_columns['points'], epd_columns['id']
+    ):
+        entry = epd_data_lookup.get(fen)
+        if entry is None:
+            entry = {'id': position_id, 'sort_key': natural_sort_key(position_id), 'scored_moves': {}}
+            epd_data_lookup[fen] = entry
+        # The first listing of a move wins, as with the old linear scan.
+        entry['scored_moves'].setdefault(move, move_points)
+
+    return epd_data_lookup
+
 
+def calculate_scores(engine_name, engine_moves, epd_data_lookup):
+    """Calculates scores and saves a sorted, detailed analysis to a CSV file."""
     total_points = 0
     suite_scores = defaultdict(int)
     results_data, warnings_data = [], []
@@ -159,26 +628,22 @@ def calculate_scores(engine_name, engine_moves, df):
             continue
 
         position_id = position_data['id']
-        scored_moves_list = position_data['scored_moves']
-        awarded_points = 0
-        for move, points in scored_moves_list:
-            if move == engine_best_move:
-                awarded_points = points
-                break
+        scored_moves = position_data['scored_moves']
+        awarded_points = scored_moves.get(engine_best_move, 0)
 
         total_points += awarded_points
         suite_id = position_id.split(' ', 1)[0]
         suite_scores[suite_id] += awarded_points
-        epd_moves_str = ", ".join([f"{move}={pts}" for move, pts in scored_moves_list])
-        results_data.append([position_id, fen, engine_best_move, epd_moves_str, awarded_points])
-
-    def version_sort_key(row):
-        return [int(s) for s in re.findall(r'\d+', row[0])]
+        epd_moves_str = ", ".join([f"{move}={pts}" for move, pts in scored_moves.items()])
+        results_data.append([position_id, fen, engine_best_move, epd_moves_str, awarded_points, position_data['sort_key']])
 
-    results_data.sort(key=version_sort_key)
+    # Natural sort on the numbers in the position id, then drop the precomputed key.
+    results_data.sort(key=operator.itemgetter(-1))
+    for row in results_data:
+        del row[-1]
 
     details_csv_filename = f"{engine_name.replace(' ', '_')}_details.csv"
-    with open(details_csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+    with open(details_csv_filename, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
         csv_writer = csv.writer(csvfile)
         csv_writer.writerow(['ID', 'FEN', 'EngineMove', 'EPDMoves', 'Points'])
         csv_writer.writerows(results_data)
@@ -189,37 +654,38 @@ def calculate_scores(engine_name, engine_moves, df):
     return total_points, suite_scores
 
 
-def generate_reports(engine_name, move_time, total_points, suite_scores, df, epd_filepath):
-    """Generates and saves the summary, strength, weakness, and overall CSV reports."""
+def generate_reports(engine_name, move_time, total_points, suite_scores, position_ids, epd_filepath, update_overall=True):
+    """Generates and saves the summary, strength, weakness, and overall CSV reports.
+
+    With update_overall False, points.csv is left untouched, e.g. for an incomplete run.
+    """
     print("Generating reports...")
 
-    id_parser_df = df[['id']].copy().drop_duplicates()
-    id_parts = id_parser_df['id'].str.split(' ', n=1, expand=True)
-    id_parser_df['SuiteId'] = id_parts[0]
-    id_parser_df['Description'] = id_parts[1].str.replace(r'\.\d+$', '', regex=True) if id_parts.shape[1] > 1 else ''
-    suite_desc_lookup = id_parser_df.set_index('SuiteId')['Description'].to_dict()
-    id_df = df.drop_duplicates(subset=['id']).copy()
-    id_df['Id'] = id_df['id'].str.split(' ', n=1).str[0]
-    suite_totals = id_df.groupby('Id')['id'].count().multiply(100).to_dict()
-
-    summary_data = [{'Id': suite, 'Points': score} for suite, score in suite_scores.items()]
-    summary_df = pd.DataFrame(summary_data)
-    summary_df['Engine'] = engine_name
-    summary_df['MTS'] = move_time
-    summary_df['Description'] = summary_df['Id'].map(suite_desc_lookup).fillna('')
-    summary_df['Total'] = summary_df['Id'].map(suite_totals).fillna(0).astype(int)
-    summary_df['Pct'] = summary_df.apply(lambda row: round((row['Points'] / row['Total']) * 100.0, 2) if row['Total'] > 0 else 0, axis=1)
-    summary_df = summary_df.sort_values(by='Id', key=lambda id_series: id_series.str.extract(r'(\d+)')[0].astype(int)).reset_index(drop=True)
-    summary_df = summary_df[['Engine', 'Id', 'Description', 'MTS', 'Points', 'Total', 'Pct']]
+    # Position ids look like "STS(v1.0) Undermine.001": suite id, description, position number.
+    # Totals count distinct ids, so a FEN listed under two ids is worth 100 points in each.
+    suite_desc_lookup = {}
+    suite_totals = defaultdict(int)
+    for position_id in dict.fromkeys(position_ids):
+        suite_id, _, description = position_id.partition(' ')
+        suite_desc_lookup[suite_id] = _POSITION_NUMBER_RE.sub('', description)
+        suite_totals[suite_id] += 100
+
+    summary_rows = []
+    for suite_id, points in suite_scores.items():
+        total = suite_totals.get(suite_id, 0)
+        pct = round((points / total) * 100.0, 2) if total > 0 else 0.0
+        summary_rows.append((engine_name, suite_id, suite_desc_lookup.get(suite_id, ''), move_time, points, total, pct))
+    summary_rows.sort(key=lambda row: natural_sort_key(row[1]))
     summary_filename = f"{engine_name.replace(' ', '_')}_summary.csv"
-    summary_df.to_csv(summary_filename, index=False)
+    save_csv(summary_filename, ['Engine', 'Id', 'Description', 'MTS', 'Points', 'Total', 'Pct'], summary_rows)
 
     grand_total_possible = sum(suite_totals.values())
-    overall_pct = round((total_points / grand_total_possible) * 100.0, 2) if grand_total_possible > 0 else 0
+    overall_pct = round((total_points / grand_total_possible) * 100.0, 2) if grand_total_possible > 0 else 0.0
 
     overall_summary_csv = "points.csv"
     test_suite_filename = os.path.basename(epd_filepath)
 
+    points_columns = ['Engine', 'TFile', 'MTS', 'Points', 'Total', 'Pct']
     new_row_data = {
         'Engine': engine_name,
         'TFile': test_suite_filename,
@@ -229,39 +695,38 @@ def generate_reports(engine_name, move_time, total_points, suite_scores, df, epd
         'Pct': overall_pct
     }
 
-    try:
-        points_df = pd.read_csv(overall_summary_csv)
-        new_row_df = pd.DataFrame([new_row_data])
-        points_df = pd.concat([points_df, new_row_df], ignore_index=True)
-    except FileNotFoundError:
-        points_df = pd.DataFrame([new_row_data])
-
-    points_df_sorted = points_df.sort_values(
-        by=['TFile', 'MTS', 'Pct'],
-        ascending=[True, True, False]
-    ).reset_index(drop=True)
-
-    points_df_sorted.to_csv(overall_summary_csv, index=False)
-
-    report_df = summary_df.copy()
-    report_df['TFile'] = test_suite_filename
-    report_df = report_df.rename(columns={'Id': 'ID'})
-    final_columns = ['Engine', 'TFile', 'ID', 'Description', 'Points', 'Total', 'Pct']
-    report_df = report_df[final_columns]
-
-    strength_df = report_df.sort_values(by='Pct', ascending=False).head(5)
+    if update_overall:
+        try:
+            with open(overall_summary_csv, 'r', newline='', encoding='utf-8') as csvfile:
+                points_rows = list(csv.DictReader(csvfile))
+        except FileNotFoundError:
+            points_rows = []
+        points_rows.append(new_row_data)
+        points_rows.sort(key=lambda row: (row['TFile'], float(row['MTS']), -float(row['Pct'])))
+        save_csv(overall_summary_csv, points_columns, [[row[col] for col in points_columns] for row in points_rows])
+
+    report_columns = ['Engine', 'TFile', 'ID', 'Description', 'Points', 'Total', 'Pct']
+    report_rows = [
+        (engine, test_suite_filename, suite_id, description, points, total, pct)
+        for engine, suite_id, description, _, points, total, pct in summary_rows
+    ]
+
+    strength_rows = sorted(report_rows, key=lambda row: row[-1], reverse=True)[:5]
     strength_filename = f"{engine_name.replace(' ', '_')}_strength.csv"
-    strength_df.to_csv(strength_filename, index=False)
+    save_csv(strength_filename, report_columns, strength_rows)
 
-    weakness_df = report_df.sort_values(by='Pct', ascending=True).head(5)
+    weakness_rows = sorted(report_rows, key=lambda row: row[-1])[:5]
     weakness_filename = f"{engine_name.replace(' ', '_')}_weakness.csv"
-    weakness_df.to_csv(weakness_filename, index=False)
+    save_csv(weakness_filename, report_columns, weakness_rows)
 
     print(f"\nEngine '{engine_name}' scored a total of {total_points} points.")
     print(f"Suite summary saved to '{summary_filename}'.")
     print(f"Strength report (top 5 by Pct) saved to '{strength_filename}'.")
     print(f"Weakness report (top 5 by Pct) saved to '{weakness_filename}'.")
-    print(f"Overall results in '{overall_summary_csv}' have been updated and sorted.")
+    if update_overall:
+        print(f"Overall results in '{overall_summary_csv}' have been updated and sorted.")
+    else:
+        print(f"Overall results in '{overall_summary_csv}' were not updated because the run is incomplete.")
 
 
 def main():
@@ -277,9 +742,20 @@ def main():
     parser.add_argument("-n", "--engine-name",
                         help="Name of the engine for reports (if not provided, queries the engine).")
 
-    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of parallel engine processes (default: 1).")
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="Number of parallel engine processes (default: number of usable physical cores).")
     parser.add_argument("-mt", "--movetime", type=float, default=1.0, help="Analysis time in seconds per move (default: 1.0).")
-    parser.add_argument("--uci-log", action="store_true", help="Enable detailed UCI communication logging to a file for each worker.")
+    parser.add_argument("--uci-log", action="store_true", help="Enable detailed UCI communication logging of all workers to a file.")
+    parser.add_argument("--isolate-positions", action="store_true",
+                        help="Send ucinewgame before every position so the engine starts each one\n"
+                             "with a cleared hash table (default: once per worker).")
+
+    parser.add_argument("--no-pin", action="store_true",
+                        help="Do not pin each worker and its engine to its own physical core.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Analyze every position even if a cached result exists for the same\n"
+                             "engine binary, movetime, options and --isolate-positions setting.\n"
+                             "Results are then not checkpointed, so an interrupted run starts over.")
 
     parser.add_argument("-o", "--option", action="append",
                         help="Set a custom UCI option for the engine.\n"
@@ -290,47 +766,81 @@ def main():
 
     if not args.engine_name:
         print("Engine name not provided, querying from engine executable...")
-        engine = None
         try:
-            engine = chess.engine.SimpleEngine.popen_uci(args.engine_path)
-            args.engine_name = engine.id['name']
+            args.engine_name = query_engine_name(args.engine_path)
             print(f"--> Detected engine name: {args.engine_name}")
         except Exception as e:
             print(f"\nError: Could not query engine name from '{args.engine_path}'.")
             print("Please specify it manually using the -n or --engine-name argument.")
             print(f"Details: {e}")
             return
-        finally:
-            if engine:
-                engine.quit()
 
-    parsed_df = parse_epd_file(args.epd_file)
-    if parsed_df is None:
+    epd_columns = parse_epd_file(args.epd_file, args.workers)
+    if epd_columns is None:
         print("Failed to parse EPD file. Exiting.")
         return
 
     t0 = time.perf_counter()
 
-    unique_fens = parsed_df['fen'].unique()
+    # dict.fromkeys dedupes while keeping the EPD file order.
+    unique_fens = list(dict.fromkeys(epd_columns['fen']))
+
+    cache_conn = None
+    cached_moves, fen_keys = {}, {}
+    if not args.no_cache:
+        cache_conn = open_cache(args.engine_name)
+        engine_id = engine_fingerprint(args.engine_path)
+        fen_keys = {
+            fen: cache_key(args.engine_name, engine_id, args.movetime, args.option, args.isolate_positions, fen)
+            for fen in unique_fens
+        }
+        cached_moves = load_cached_moves(cache_conn, fen_keys)
+        print(f"Found {len(cached_moves)} of {len(unique_fens)} positions in the cache.")
+
+    fens_to_analyze = [fen for fen in unique_fens if fen not in cached_moves]
+
+    log_queue, log_listener = None, None
+    if args.uci_log:
+        log_queue, log_listener = start_uci_log_listener(args.engine_name)
+
     analysis_results = run_analysis(
-        fens_to_analyze=list(unique_fens),
+        fens_to_analyze=fens_to_analyze,
         num_workers=args.workers,
-        engine_name=args.engine_name,
         engine_path=args.engine_path,
         move_time=args.movetime,
         custom_options=args.option,
-        enable_uci_log=args.uci_log
+        log_queue=log_queue,
+        isolate_positions=args.isolate_positions,
+        pin_workers=not args.no_pin,
+        save_results=functools.partial(store_cached_moves, cache_conn, fen_keys) if cache_conn else None
     )
 
-    total_points, suite_scores = calculate_scores(args.engine_name, analysis_results, parsed_df)
+    if log_listener:
+        stop_uci_log_listener(log_listener)
+
+    if cache_conn:
+        cache_conn.close()
+
+    # Positions lost to failed workers would silently score zero against the full suite total.
+    missing_positions = len(fens_to_analyze) - len(analysis_results)
+    if missing_positions:
+        print(f"\nWarning: {missing_positions} of {len(fens_to_analyze)} positions were not analyzed, "
+              "the scores below are incomplete.")
+        if cache_conn:
+            print("Finished positions are cached, rerun the same command to analyze the rest.")
+    analysis_results = {**cached_moves, **analysis_results}
+
+    epd_data_lookup = build_epd_lookup(epd_columns)
+    total_points, suite_scores = calculate_scores(args.engine_name, analysis_results, epd_data_lookup)
     t1 = time.perf_counter()
-    generate_reports(args.engine_name, args.movetime, total_points, suite_scores, parsed_df, args.epd_file)
+    generate_reports(args.engine_name, args.movetime, total_points, suite_scores, epd_columns['id'], args.epd_file,
+                     update_overall=not missing_positions)
 
     print(f'\nElapsed (sec): {round(t1-t0,0)}')
 
     if args.uci_log:
         engine_name_safe = args.engine_name.replace(' ', '_')
-        print(f"Detailed engine communication saved to '{engine_name_safe}_analysis_worker_*.txt'.")
+        print(f"Detailed engine communication saved to '{engine_name_safe}_analysis.txt'.")
 
 
 if __name__ == "__main__":